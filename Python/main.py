@@ -2,12 +2,22 @@
 # -*- coding: utf-8 -*-
 
 import sys
+import csv
+import io
 import json
 import os
-import requests
+import functools
+import tempfile
+from collections import deque
+from itertools import groupby
 from datetime import datetime
 from colorama import init, Fore, Style
 
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него используется стандартный json
+    orjson = None
+
 # Настройка кодировки для Windows
 if sys.platform == 'win32':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -16,22 +26,103 @@ if sys.platform == 'win32':
 init(autoreset=True)
 
 API_URL = "https://api.exchangerate-api.com/v4/latest/"
-HISTORY_FILE = "history.json"
+HISTORY_FILE = "history.jsonl"
+LEGACY_HISTORY_FILE = "history.json"  # до перехода на JSON Lines
+HISTORY_MAX_ENTRIES = 1000
+HISTORY_TRIM_SLACK = 100  # сколько лишних записей копится до обрезки файла
+HISTORY_TRIM_CHECK_BYTES = 16 * 1024  # ~100 записей: как часто проверять размер истории
 CONFIG_FILE = "config.json"
 CACHE_FILE = "cache.json"
 CACHE_TTL = 60  # минут
+# Флаги командной строки: без значения и со значением (--batch <файл>)
+BOOL_FLAGS = {"--json", "--csv", "--table", "--offline", "--history", "--help", "-h"}
+VALUE_FLAGS = {"--batch"}
+
+# Поля ответа API, которые использует программа; остальное не хранится в кэше
+RATES_FIELDS = ("time_last_updated", "rates")
+MAX_WORKERS = 4  # параллельных запросов к API в пакетном режиме
+
+# Цветовые префиксы вывода (собираются один раз, а не при каждом print)
+_HEADER = Fore.GREEN + Style.BRIGHT
+_TITLE = Fore.YELLOW + Style.BRIGHT
+_NOTE = Fore.YELLOW
+_OK = Fore.GREEN
+_ERR = Fore.RED
+_ACC = Fore.CYAN
+_DIM = Fore.LIGHTBLACK_EX
+_RESET = Style.RESET_ALL
+_TREND_UP = _OK + "▲ " + _RESET
+_TREND_DOWN = _ERR + "▼ " + _RESET
+
+# Заголовок программы целиком, одной строкой для одного вызова write
+_HEADER_BLOCK = (
+    _HEADER + "╔════════════════════════════════════════╗" + _RESET + "\n"
+    + _HEADER + "║   КОНВЕРТЕР ВАЛЮТ (Python Version)     ║" + _RESET + "\n"
+    + _HEADER + "╚════════════════════════════════════════╝" + _RESET + "\n"
+    + "\n"
+)
+
+# Общая HTTP-сессия: соединение с API переиспользуется между запросами.
+# Создаётся при первом запросе, чтобы --help и --history не импортировали requests.
+_SESSION = None
+
+# Выставляется save_to_history, когда дописанная запись пересекла очередную
+# границу HISTORY_TRIM_CHECK_BYTES: только тогда trim_history читает файл
+_history_trim_due = False
+
+
+def _json_loads(raw):
+    """Разбирает JSON из bytes/str (через orjson, если он установлен)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _json_dumps(obj, indent=True):
+    """Сериализует объект в JSON (UTF-8 bytes; с отступом 2 пробела или в одну строку)"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+
+def _atomic_write(path, data):
+    """Атомарно заменяет содержимое файла path на data (bytes)
+
+    Данные пишутся во временный файл с уникальным именем в том же каталоге,
+    поэтому одновременные запуски не пишут в один файл. При ошибке временный
+    файл удаляется, а исключение пробрасывается дальше.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
 
 
+@functools.lru_cache(maxsize=1)
 def load_config():
-    """Загружает конфигурацию из config.json"""
+    """Загружает конфигурацию из config.json (читается один раз за запуск)
+
+    Возвращается общий словарь — его не следует изменять.
+    Сбросить кэш можно через load_config.cache_clear().
+    """
     config = {
         "default_from": "USD",
         "default_to": "RUB",
-        "output_format": "text"
+        "output_format": "text",
+        "cache_ttl": CACHE_TTL,
+        "history_max_entries": HISTORY_MAX_ENTRIES
     }
     try:
-        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-            user_config = json.load(f)
+        with open(CONFIG_FILE, 'rb') as f:
+            user_config = _json_loads(f.read())
             config.update(user_config)
     except (FileNotFoundError, json.JSONDecodeError):
         pass
@@ -43,40 +134,36 @@ def load_config():
 
 def print_help():
     """Выводит справку по использованию программы"""
-    print(Fore.GREEN + Style.BRIGHT + "╔════════════════════════════════════════╗")
-    print(Fore.GREEN + Style.BRIGHT + "║   КОНВЕРТЕР ВАЛЮТ (Python Version)     ║")
-    print(Fore.GREEN + Style.BRIGHT + "╚════════════════════════════════════════╝")
-    print()
-    print(Fore.YELLOW + Style.BRIGHT + "Использование:")
+    sys.stdout.write(_HEADER_BLOCK)
+    print(_TITLE + "Использование:")
     print("  python main.py [флаги] <from> <to> <amount>")
     print("  python main.py [флаги] <from> <to1,to2,...> <amount>")
     print()
-    print(Fore.YELLOW + Style.BRIGHT + "Флаги вывода:")
-    print(Fore.CYAN + "  --json       Вывод результата в формате JSON")
-    print(Fore.CYAN + "  --csv        Вывод результата в формате CSV")
-    print(Fore.CYAN + "  --table      Вывод результата в виде таблицы")
+    print(_TITLE + "Флаги вывода:")
+    print(_ACC + "  --json       Вывод результата в формате JSON")
+    print(_ACC + "  --csv        Вывод результата в формате CSV")
+    print(_ACC + "  --table      Вывод результата в виде таблицы")
     print()
-    print(Fore.YELLOW + Style.BRIGHT + "Прочие флаги:")
-    print(Fore.CYAN + "  --offline    Использовать сохранённые курсы без запроса к API")
-    print(Fore.CYAN + "  --history          Показать историю всех конвертаций")
-    print(Fore.CYAN + "  --history USD/RUB  Показать историю по конкретной паре")
-    print(Fore.CYAN + "  --help, -h   Показать эту справку")
+    print(_TITLE + "Прочие флаги:")
+    print(_ACC + "  --offline    Использовать сохранённые курсы без запроса к API")
+    print(_ACC + "  --batch FILE Пакетная конвертация: строки from,to,amount из файла")
+    print(_ACC + "  --history          Показать историю всех конвертаций")
+    print(_ACC + "  --history USD/RUB  Показать историю по конкретной паре")
+    print(_ACC + "  --help, -h   Показать эту справку")
     print()
-    print(Fore.YELLOW + Style.BRIGHT + "Примеры:")
+    print(_TITLE + "Примеры:")
     print("  python main.py USD RUB 100")
     print("  python main.py --table USD RUB,EUR,CNY 100")
     print("  python main.py --json USD EUR 50")
     print("  python main.py --offline USD RUB 100")
+    print("  python main.py --batch conversions.csv")
     print("  python main.py --history USD/RUB")
     print()
 
 
 def print_header():
     """Выводит заголовок программы"""
-    print(Fore.GREEN + Style.BRIGHT + "╔════════════════════════════════════════╗")
-    print(Fore.GREEN + Style.BRIGHT + "║   КОНВЕРТЕР ВАЛЮТ (Python Version)     ║")
-    print(Fore.GREEN + Style.BRIGHT + "╚════════════════════════════════════════╝")
-    print()
+    sys.stdout.write(_HEADER_BLOCK)
 
 
 def get_input(prompt):
@@ -90,147 +177,267 @@ def get_amount(prompt):
         try:
             amount = float(input(prompt).strip())
             if amount <= 0:
-                print(Fore.RED + "❌ Сумма должна быть положительной!")
+                print(_ERR + "❌ Сумма должна быть положительной!")
                 continue
             return amount
         except ValueError:
-            print(Fore.RED + "❌ Ошибка: введите корректное число!")
+            print(_ERR + "❌ Ошибка: введите корректное число!")
 
 
 def load_cache():
     """Загружает кэш курсов из файла"""
     try:
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open(CACHE_FILE, 'rb') as f:
+            return _json_loads(f.read())
     except (FileNotFoundError, json.JSONDecodeError):
         return {}
 
 
 def save_cache(cache):
-    """Сохраняет кэш курсов в файл"""
+    """Сохраняет кэш курсов в файл (атомарно, через временный файл)"""
     try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, indent=2, ensure_ascii=False)
+        _atomic_write(CACHE_FILE, _json_dumps(cache))
     except Exception:
         pass
 
 
-def get_exchange_rates(base_currency, silent=False, offline=False):
-    """Получает курсы валют из кэша или API"""
+def _get_session():
+    """Возвращает общую HTTP-сессию, создавая её при первом вызове"""
+    global _SESSION
+    if _SESSION is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _SESSION = requests.Session()
+        _SESSION.mount("https://", HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+    return _SESSION
+
+
+def fetch_rates(base_currency, entry=None):
+    """Загружает курсы валют из API и возвращает новую запись кэша
+
+    Если передана устаревшая запись кэша с ETag/Last-Modified, запрос делается
+    условным: при ответе 304 курсы не скачиваются заново, а берутся из неё.
+    Из ответа сохраняются только нужные поля.
+    """
+    headers = {}
+    if entry:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = _get_session().get(f"{API_URL}{base_currency}", headers=headers, timeout=10)
+    fetched_at = datetime.now().isoformat()
+    if response.status_code == 304 and entry:
+        return dict(entry, fetched_at=fetched_at)
+
+    response.raise_for_status()
+    data = _json_loads(response.content)
+    return {
+        "fetched_at": fetched_at,
+        "data": {key: data[key] for key in RATES_FIELDS if key in data},
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def _try_fetch_rates(base_currency, entry=None):
+    """Как fetch_rates, но возвращает None при сетевой ошибке или ошибке парсинга"""
+    import requests
+    try:
+        return fetch_rates(base_currency, entry)
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+
+
+def get_exchange_rates(base_currency, silent=False, offline=False, ttl=CACHE_TTL):
+    """Получает курсы валют из кэша или API (кэш действителен ttl минут)
+
+    Возвращает (data, None) при успехе и (None, ошибка) при неудаче: ошибка —
+    короткое сообщение для JSON/CSV, подробности выводятся сразу, если не silent.
+    """
     cache = load_cache()
-    if base_currency in cache:
-        entry = cache[base_currency]
+    entry = cache.get(base_currency)
+    if entry:
         fetched_at = datetime.fromisoformat(entry["fetched_at"])
         age_minutes = (datetime.now() - fetched_at).total_seconds() / 60
-        if offline or age_minutes < CACHE_TTL:
+        if offline or age_minutes < ttl:
             if not silent:
                 if offline:
-                    print(Fore.LIGHTBLACK_EX + f"📴 Оффлайн режим: используются сохранённые курсы от {fetched_at.strftime('%Y-%m-%d %H:%M')}")
+                    print(_DIM + f"📴 Оффлайн режим: используются сохранённые курсы от {entry['fetched_at'][:16].replace('T', ' ')}")
                 else:
-                    remaining = int(CACHE_TTL - age_minutes)
-                    print(Fore.LIGHTBLACK_EX + f"💾 Используются кэшированные курсы (обновление через {remaining} мин.)")
-            return entry["data"]
+                    remaining = int(ttl - age_minutes)
+                    print(_DIM + f"💾 Используются кэшированные курсы (обновление через {remaining} мин.)")
+            return entry["data"], None
 
     if offline:
-        print(Fore.RED + f"❌ Нет сохранённых курсов для {base_currency} — выполните конвертацию онлайн хотя бы раз")
-        sys.exit(1)
+        if not silent:
+            print(_ERR + f"❌ Нет сохранённых курсов для {base_currency} — выполните конвертацию онлайн хотя бы раз")
+        return None, f"нет сохранённых курсов для {base_currency}"
 
+    import requests
     try:
         if not silent:
-            print(Fore.CYAN + "🔄 Загрузка актуальных курсов валют...")
-        response = requests.get(f"{API_URL}{base_currency}", timeout=10)
-        response.raise_for_status()
-        data = response.json()
+            print(_ACC + "🔄 Загрузка актуальных курсов валют...")
+        entry = fetch_rates(base_currency, entry)
     except requests.exceptions.RequestException as e:
         if not silent:
-            print(Fore.RED + f"❌ Ошибка при получении курсов: {e}")
-        sys.exit(1)
+            print(_ERR + f"❌ Ошибка при получении курсов: {e}")
+        return None, "ошибка при получении курсов"
     except ValueError as e:
         if not silent:
-            print(Fore.RED + f"❌ Ошибка парсинга ответа API: {e}")
-        sys.exit(1)
+            print(_ERR + f"❌ Ошибка парсинга ответа API: {e}")
+        return None, "ошибка парсинга ответа API"
 
     # Сохраняем в кэш
-    cache[base_currency] = {"fetched_at": datetime.now().isoformat(), "data": data}
+    cache[base_currency] = entry
     save_cache(cache)
-    return data
+    return entry["data"], None
 
 
-def format_time_ago(time_diff):
-    """Форматирует время, прошедшее с момента обновления"""
-    total_seconds = int(time_diff.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-
-    if hours > 24:
-        days = hours // 24
-        if days == 1:
-            return "1 день назад"
-        elif days < 5:
-            return f"{days} дня назад"
-        else:
-            return f"{days} дней назад"
+def get_exchange_rates_batch(bases, offline=False, ttl=CACHE_TTL):
+    """Получает курсы для нескольких базовых валют, недостающие загружает параллельно
 
-    if hours > 0:
-        if hours == 1:
-            return "1 час назад"
-        elif hours < 5:
-            return f"{hours} часа назад"
-        else:
-            return f"{hours} часов назад"
+    Возвращает словарь {валюта: данные}; валюты, курсы которых получить
+    не удалось, в словарь не попадают.
+    """
+    cache = load_cache()
+    now = datetime.now()
+    rates = {}
+    missing = []
+    for base in bases:
+        entry = cache.get(base)
+        if entry:
+            age_minutes = (now - datetime.fromisoformat(entry["fetched_at"])).total_seconds() / 60
+            if offline or age_minutes < ttl:
+                rates[base] = entry["data"]
+                continue
+        missing.append(base)
 
-    if minutes > 0:
-        if minutes == 1:
-            return "1 минуту назад"
-        elif minutes < 5:
-            return f"{minutes} минуты назад"
-        else:
-            return f"{minutes} минут назад"
+    if offline or not missing:
+        return rates
 
-    return "только что"
+    # Один запрос выполняем напрямую, несколько — параллельно в пуле потоков
+    stale = [cache.get(base) for base in missing]
+    if len(missing) == 1:
+        fetched = [_try_fetch_rates(missing[0], stale[0])]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        # Сессию создаём заранее, чтобы потоки не создали каждый свою
+        _get_session()
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(missing))) as pool:
+            fetched = list(pool.map(_try_fetch_rates, missing, stale))
+
+    for base, entry in zip(missing, fetched):
+        if entry is None:
+            continue
+        cache[base] = entry
+        rates[base] = entry["data"]
+
+    save_cache(cache)
+    return rates
+
+
+def load_batch(path):
+    """Читает файл пакетной конвертации: по строке from,to,amount на конвертацию"""
+    jobs = []
+    # Локальные ссылки на методы: в цикле по строкам файла не ищем их заново
+    strip = str.strip
+    upper = str.upper
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = strip(line)
+            if not line or line.startswith("#"):
+                continue
+            parts = list(map(strip, line.split(",")))
+            if len(parts) != 3:
+                raise ValueError(f"строка {line_no}: ожидается from,to,amount")
+            try:
+                amount = float(parts[2])
+            except ValueError:
+                raise ValueError(f"строка {line_no}: неверная сумма")
+            if amount <= 0:
+                raise ValueError(f"строка {line_no}: сумма должна быть положительной")
+            jobs.append((upper(parts[0]), upper(parts[1]), amount))
+    return jobs
 
 
-def convert_currency(amount, _, to_currency, rates_data):
-    """Конвертирует валюту"""
-    rates = rates_data.get('rates', {})
+# Единицы для format_time_ago: (секунд в единице, формы для 1 / 2-4 / 5+)
+_TIME_UNITS = (
+    (86400, ("день", "дня", "дней")),
+    (3600, ("час", "часа", "часов")),
+    (60, ("минуту", "минуты", "минут")),
+)
 
-    if to_currency not in rates:
-        print(Fore.RED + f"❌ Валюта {to_currency} не найдена!")
-        sys.exit(1)
 
-    rate = rates[to_currency]
-    result = amount * rate
-    return result, rate
+def _ru_plural(n, forms):
+    """Выбирает форму слова для числа n по правилам русского языка"""
+    if n % 10 == 1 and n % 100 != 11:
+        return forms[0]
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return forms[1]
+    return forms[2]
 
 
-def print_result(amount, from_currency, result, to_currency, rate, rates_data):
-    """Выводит результат конвертации"""
-    print()
-    print(Fore.YELLOW + Style.BRIGHT + "════════════════ РЕЗУЛЬТАТ ════════════════")
+def format_time_ago(time_diff):
+    """Форматирует время, прошедшее с момента обновления"""
+    total_seconds = int(time_diff.total_seconds())
+    for seconds, forms in _TIME_UNITS:
+        count = total_seconds // seconds
+        if count > 0:
+            return f"{count} {_ru_plural(count, forms)} назад"
+    return "только что"
 
-    print(Fore.GREEN + f"{amount:.2f} {from_currency} = {result:.2f} {to_currency}")
 
-    print()
-    print(Fore.CYAN + f"Курс: 1 {from_currency} = {rate:.4f} {to_currency}")
+def _convert_one(amount, to_currency, rates):
+    """Конвертирует сумму по готовому словарю курсов; None, если валюты нет"""
+    rate = rates.get(to_currency)
+    if rate is None:
+        return None
+    return amount * rate, rate
+
+
+def convert_many(amount, to_currencies, rates_data):
+    """Конвертирует сумму во все целевые валюты за один проход
+
+    Для каждой валюты возвращает (валюта, результат, курс); для неизвестных
+    валют результат и курс равны None.
+    """
+    rates = rates_data.get('rates', {})
+    for to_currency in to_currencies:
+        converted = _convert_one(amount, to_currency, rates)
+        if converted is None:
+            yield to_currency, None, None
+        else:
+            yield (to_currency,) + converted
+
+
+def print_result(amount, from_currency, result, to_currency, rate, update_time, now):
+    """Выводит результат конвертации (update_time — время курсов или None)"""
+    parts = [
+        "",
+        _TITLE + "════════════════ РЕЗУЛЬТАТ ════════════════" + _RESET,
+        f"{_OK}{amount:.2f} {from_currency} = {result:.2f} {to_currency}{_RESET}",
+        "",
+        f"{_ACC}Курс: 1 {from_currency} = {rate:.4f} {to_currency}{_RESET}",
+    ]
 
     # Вывод времени последнего обновления
-    timestamp = rates_data.get('time_last_updated', 0)
-    if timestamp:
-        update_time = datetime.fromtimestamp(timestamp)
-        time_diff = datetime.now() - update_time
-        time_ago = format_time_ago(time_diff)
-        print()
-        print(Fore.LIGHTBLACK_EX + f"Последнее обновление: {update_time.strftime('%Y-%m-%d %H:%M:%S')} ({time_ago})")
+    if update_time:
+        time_ago = format_time_ago(now - update_time)
+        parts.append("")
+        parts.append(f"{_DIM}Последнее обновление: {update_time.isoformat(sep=' ', timespec='seconds')} ({time_ago}){_RESET}")
 
-    print()
-    print(Fore.YELLOW + Style.BRIGHT + "═══════════════════════════════════════════")
+    parts.append("")
+    parts.append(_TITLE + "═══════════════════════════════════════════" + _RESET)
+    sys.stdout.write("\n".join(parts) + "\n")
 
 
-def output_json(from_currency, to_currency, amount, result, rate, update_time):
+def output_json(from_currency, to_currency, amount, result, rate, update_time, now_iso):
     """Выводит результат в формате JSON"""
     output = {
         "success": True,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso,
         "from_currency": from_currency,
         "to_currency": to_currency,
         "amount": amount,
@@ -241,10 +448,10 @@ def output_json(from_currency, to_currency, amount, result, rate, update_time):
     print(json.dumps(output, indent=2, ensure_ascii=False))
 
 
-def output_csv(from_currency, to_currency, amount, result, rate):
+def output_csv(from_currency, to_currency, amount, result, rate, now_iso):
     """Выводит результат в формате CSV"""
     # timestamp,from,to,amount,result,rate
-    print(f"{datetime.now().isoformat()},{from_currency},{to_currency},{amount:.2f},{result:.2f},{rate:.6f}")
+    print(f"{now_iso},{from_currency},{to_currency},{amount:.2f},{result:.2f},{rate:.6f}")
 
 
 def output_error(message, as_json=True):
@@ -256,14 +463,16 @@ def output_error(message, as_json=True):
         }
         print(json.dumps(output, indent=2, ensure_ascii=False))
     else:
-        # CSV формат ошибки
-        print(f"error,{message}")
+        # CSV формат ошибки: error,<сообщение>; сообщение с запятыми или кавычками экранируется
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(["error", message])
+        sys.stdout.write(buf.getvalue())
 
 
-def save_to_history(from_currency, to_currency, amount, result, rate, update_time):
+def save_to_history(from_currency, to_currency, amount, result, rate, update_time, now_iso):
     """Сохраняет запись в историю конвертаций"""
     record = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": now_iso,
         "from_currency": from_currency,
         "to_currency": to_currency,
         "amount": amount,
@@ -272,23 +481,85 @@ def save_to_history(from_currency, to_currency, amount, result, rate, update_tim
         "rate_update_time": update_time.isoformat()
     }
 
-    # Читаем существующую историю
-    history = []
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            history = []
-
-    # Добавляем новую запись
-    history.append(record)
+    global _history_trim_due
+    line = _json_dumps(record, indent=False) + b"\n"
 
-    # Сохраняем обратно
+    # JSON Lines: дописываем одну строку, не перечитывая файл
     try:
-        with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+        with open(HISTORY_FILE, 'ab') as f:
+            f.write(line)
+            end = f.tell()
     except Exception:
+        return
+    if end // HISTORY_TRIM_CHECK_BYTES != (end - len(line)) // HISTORY_TRIM_CHECK_BYTES:
+        _history_trim_due = True
+
+
+def iter_history():
+    """Построчно читает историю конвертаций, пропуская повреждённые строки"""
+    with open(HISTORY_FILE, 'rb') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = _json_loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def trim_history(max_entries=HISTORY_MAX_ENTRIES):
+    """Оставляет в истории только последние max_entries записей (0 — без ограничения)
+
+    Файл читается, только если с прошлой проверки история выросла ещё
+    на HISTORY_TRIM_CHECK_BYTES, и переписывается, только когда лишних
+    записей накопилось больше HISTORY_TRIM_SLACK.
+    """
+    global _history_trim_due
+    if max_entries <= 0 or not _history_trim_due:
+        return
+    _history_trim_due = False
+    try:
+        with open(HISTORY_FILE, 'rb') as f:
+            tail = deque(f, maxlen=max_entries + HISTORY_TRIM_SLACK + 1)
+    except OSError:
+        return
+    if len(tail) <= max_entries + HISTORY_TRIM_SLACK:
+        return
+
+    lines = list(tail)[-max_entries:]
+    try:
+        _atomic_write(HISTORY_FILE, b"".join(lines))
+    except OSError:
+        pass
+
+
+def migrate_legacy_history():
+    """Переносит историю из history.json (JSON-массив) в history.jsonl
+
+    Старый файл после переноса переименовывается в history.json.bak,
+    поэтому миграция выполняется один раз.
+    """
+    try:
+        with open(LEGACY_HISTORY_FILE, 'rb') as f:
+            history = _json_loads(f.read())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+
+    lines = [_json_dumps(rec, indent=False) + b"\n" for rec in history]
+    # Записи, уже сделанные в новом формате, идут после старых
+    try:
+        with open(HISTORY_FILE, 'rb') as f:
+            lines.append(f.read())
+    except FileNotFoundError:
+        pass
+
+    try:
+        _atomic_write(HISTORY_FILE, b"".join(lines))
+        os.replace(LEGACY_HISTORY_FILE, LEGACY_HISTORY_FILE + ".bak")
+    except OSError:
         pass
 
 
@@ -302,30 +573,33 @@ def filter_history(history, filter_pair):
     return [r for r in history if r['from_currency'] == filter_pair or r['to_currency'] == filter_pair]
 
 
-def show_history(filter_pair=""):
-    """Показывает историю конвертаций, сгруппированную по валютным парам"""
-    if not os.path.exists(HISTORY_FILE):
-        print(Fore.RED + "❌ История конвертаций пуста или файл не найден")
-        return
+def show_history(filter_pair="", max_entries=HISTORY_MAX_ENTRIES):
+    """Показывает историю конвертаций, сгруппированную по валютным парам
 
+    Учитываются только последние max_entries записей (0 — все): файл
+    обрезается не после каждой записи и может быть длиннее лимита.
+    """
+    # Чтение и фильтрация по паре (например "USD/RUB") идут за один проход,
+    # поэтому ошибки чтения файла ловятся в одном месте
     try:
-        with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-            history = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        print(Fore.RED + "❌ Ошибка чтения файла истории")
+        records = iter_history()
+        if max_entries > 0:
+            records = deque(records, maxlen=max_entries)
+        history = filter_history(records, filter_pair) if filter_pair else list(records)
+    except FileNotFoundError:
+        print(_ERR + "❌ История конвертаций пуста или файл не найден")
+        return
+    except OSError:
+        print(_ERR + "❌ Ошибка чтения файла истории")
         return
 
     if not history:
-        print(Fore.YELLOW + "📝 История конвертаций пуста")
+        if filter_pair:
+            print(_NOTE + f"📝 Записей для {filter_pair} не найдено")
+        else:
+            print(_NOTE + "📝 История конвертаций пуста")
         return
 
-    # Фильтруем по паре если задан фильтр (например "USD/RUB")
-    if filter_pair:
-        history = filter_history(history, filter_pair)
-        if not history:
-            print(Fore.YELLOW + f"📝 Записей для {filter_pair} не найдено")
-            return
-
     # Группируем по паре FROM/TO с сохранением порядка
     groups = {}
     order = []
@@ -336,9 +610,13 @@ def show_history(filter_pair=""):
             order.append(key)
         groups[key].append(rec)
 
-    print(Fore.GREEN + Style.BRIGHT + "╔════════════════════════════════════════╗")
-    print(Fore.GREEN + Style.BRIGHT + "║      ИСТОРИЯ КОНВЕРТАЦИЙ               ║")
-    print(Fore.GREEN + Style.BRIGHT + "╚════════════════════════════════════════╝")
+    # Собираем весь вывод и пишем его одним вызовом, а не print() на каждую строку
+    lines = [
+        _HEADER + "╔════════════════════════════════════════╗" + _RESET,
+        _HEADER + "║      ИСТОРИЯ КОНВЕРТАЦИЙ               ║" + _RESET,
+        _HEADER + "╚════════════════════════════════════════╝" + _RESET,
+    ]
+    add = lines.append
 
     total = 0
     for key in order:
@@ -346,87 +624,189 @@ def show_history(filter_pair=""):
         total += len(records)
         from_cur, to_cur = key
 
-        print()
-        print(Fore.YELLOW + Style.BRIGHT + f"  {from_cur} → {to_cur} ({len(records)} записей)")
-        print(Fore.YELLOW + Style.BRIGHT + "  ┌─────────────────────┬──────────────┬──────────────────┬──────────────┬────┐")
-        print(Fore.YELLOW + Style.BRIGHT + "  │ Дата                │ Сумма        │ Результат        │ Курс         │    │")
-        print(Fore.YELLOW + Style.BRIGHT + "  ├─────────────────────┼──────────────┼──────────────────┼──────────────┼────┤")
-
-        for i, rec in enumerate(records):
-            timestamp = datetime.fromisoformat(rec['timestamp'])
+        add("")
+        add(f"{_TITLE}  {from_cur} → {to_cur} ({len(records)} записей){_RESET}")
+        add(_TITLE + "  ┌─────────────────────┬──────────────┬──────────────────┬──────────────┬────┐" + _RESET)
+        add(_TITLE + "  │ Дата                │ Сумма        │ Результат        │ Курс         │    │" + _RESET)
+        add(_TITLE + "  ├─────────────────────┼──────────────┼──────────────────┼──────────────┼────┤" + _RESET)
+
+        prev_rate = None
+        for rec in records:
+            # ISO-строка уже начинается с "YYYY-MM-DDTHH:MM" — разбор не нужен
+            timestamp = rec['timestamp'][:16].replace('T', ' ')
+            rate = rec['exchange_rate']
             trend = "  "
-            if i > 0:
-                prev_rate = records[i-1]['exchange_rate']
-                if rec['exchange_rate'] > prev_rate:
-                    trend = Fore.GREEN + "▲ " + Style.RESET_ALL
-                elif rec['exchange_rate'] < prev_rate:
-                    trend = Fore.RED + "▼ " + Style.RESET_ALL
-            print(Fore.GREEN + f"  │ {timestamp.strftime('%Y-%m-%d %H:%M'):<19} │ {rec['amount']:<12.2f} │ {rec['result']:<16.2f} │ {rec['exchange_rate']:<12.4f} │ {trend}│")
+            if prev_rate is not None:
+                if rate > prev_rate:
+                    trend = _TREND_UP
+                elif rate < prev_rate:
+                    trend = _TREND_DOWN
+            prev_rate = rate
+            add(f"{_OK}  │ {timestamp:<19} │ {rec['amount']:<12.2f} │ {rec['result']:<16.2f} │ {rate:<12.4f} │ {trend}│{_RESET}")
 
-        print(Fore.YELLOW + Style.BRIGHT + "  └─────────────────────┴──────────────┴──────────────────┴──────────────┴────┘")
+        add(_TITLE + "  └─────────────────────┴──────────────┴──────────────────┴──────────────┴────┘" + _RESET)
 
         # Статистика
         rates = [r['exchange_rate'] for r in records]
-        print(Fore.LIGHTBLACK_EX + f"  Мин: {min(rates):.4f}  Макс: {max(rates):.4f}  Средний: {sum(rates)/len(rates):.4f}")
+        add(f"{_DIM}  Мин: {min(rates):.4f}  Макс: {max(rates):.4f}  Средний: {sum(rates)/len(rates):.4f}{_RESET}")
 
-    print()
-    print(Fore.YELLOW + Style.BRIGHT + f"Всего записей: {total}")
+    add("")
+    add(f"{_TITLE}Всего записей: {total}{_RESET}")
+    sys.stdout.write("\n".join(lines) + "\n")
 
 
-def print_table(amount, from_currency, rows, rates_data):
-    """Выводит результаты конвертации в виде таблицы"""
+def print_table(amount, from_currency, rows, update_time, now):
+    """Выводит результаты конвертации в виде таблицы (update_time — время курсов или None)"""
     print()
-    print(Fore.YELLOW + Style.BRIGHT + f"  Конвертация {amount:.2f} {from_currency}")
-    print(Fore.YELLOW + Style.BRIGHT + "  ┌──────────┬────────────────┬──────────────┐")
-    print(Fore.YELLOW + Style.BRIGHT + "  │ Валюта   │ Результат      │ Курс         │")
-    print(Fore.YELLOW + Style.BRIGHT + "  ├──────────┼────────────────┼──────────────┤")
+    print(_TITLE + f"  Конвертация {amount:.2f} {from_currency}")
+    print(_TITLE + "  ┌──────────┬────────────────┬──────────────┐")
+    print(_TITLE + "  │ Валюта   │ Результат      │ Курс         │")
+    print(_TITLE + "  ├──────────┼────────────────┼──────────────┤")
     for currency, result, rate in rows:
-        print(Fore.GREEN + f"  │ {currency:<8} │ {result:<14.2f} │ {rate:<12.4f} │")
-    print(Fore.YELLOW + Style.BRIGHT + "  └──────────┴────────────────┴──────────────┘")
+        print(f"{_OK}  │ {currency:<8} │ {result:<14.2f} │ {rate:<12.4f} │")
+    print(_TITLE + "  └──────────┴────────────────┴──────────────┘")
 
-    timestamp = rates_data.get('time_last_updated', 0)
-    if timestamp:
-        update_time = datetime.fromtimestamp(timestamp)
-        time_diff = datetime.now() - update_time
-        time_ago = format_time_ago(time_diff)
+    if update_time:
+        time_ago = format_time_ago(now - update_time)
         print()
-        print(Fore.LIGHTBLACK_EX + f"  Последнее обновление: {update_time.strftime('%Y-%m-%d %H:%M:%S')} ({time_ago})")
+        print(_DIM + f"  Последнее обновление: {update_time.isoformat(sep=' ', timespec='seconds')} ({time_ago})")
     print()
 
 
+def emit_results(amount, from_currency, to_currencies, rates_data, json_output, csv_output, table_output, now):
+    """Конвертирует сумму во все целевые валюты, сохраняет в историю и выводит результат
+
+    now — момент запуска: одно и то же время попадает в историю, JSON и CSV.
+    """
+    now_iso = now.isoformat()
+    timestamp = rates_data.get('time_last_updated', 0)
+    update_time = datetime.fromtimestamp(timestamp) if timestamp else None
+    rate_time = update_time or now
+
+    # Для табличного режима собираем все результаты, затем выводим таблицу
+    if table_output:
+        rows = []
+        for to_currency, result, rate in convert_many(amount, to_currencies, rates_data):
+            if rate is None:
+                print(_ERR + f"❌ Валюта {to_currency} не найдена!")
+                continue
+            save_to_history(from_currency, to_currency, amount, result, rate, rate_time, now_iso)
+            rows.append((to_currency, result, rate))
+        print_table(amount, from_currency, rows, update_time, now)
+        return
+
+    # Выполняем конвертацию для каждой валюты
+    for to_currency, result, rate in convert_many(amount, to_currencies, rates_data):
+        if rate is None:
+            if json_output or csv_output:
+                output_error(f"валюта {to_currency} не найдена", json_output)
+            else:
+                print(_ERR + f"❌ Валюта {to_currency} не найдена!")
+            continue
+
+        save_to_history(from_currency, to_currency, amount, result, rate, rate_time, now_iso)
+
+        if json_output:
+            output_json(from_currency, to_currency, amount, result, rate, rate_time, now_iso)
+        elif csv_output:
+            output_csv(from_currency, to_currency, amount, result, rate, now_iso)
+        else:
+            print_result(amount, from_currency, result, to_currency, rate, update_time, now)
+
+
+def run_batch(path, json_output, csv_output, table_output, offline_mode, ttl, now):
+    """Выполняет пакетную конвертацию из файла
+
+    Возвращает False, если хотя бы для одной исходной валюты не удалось
+    получить курсы (остальные строки при этом всё равно обрабатываются).
+    """
+    try:
+        jobs = load_batch(path)
+    except (OSError, ValueError) as e:
+        if json_output or csv_output:
+            output_error(f"ошибка чтения файла {path}: {e}", json_output)
+        else:
+            print(_ERR + f"❌ Ошибка чтения файла {path}: {e}")
+        sys.exit(1)
+
+    # Множество исходных валют нужно только для загрузки курсов
+    all_rates = get_exchange_rates_batch({job[0] for job in jobs}, offline=offline_mode, ttl=ttl)
+
+    # Вывод идёт в порядке строк файла; объединяются только соседние строки
+    # с одинаковой исходной валютой и суммой (одна таблица в режиме --table)
+    ok = True
+    for (from_currency, amount), group in groupby(jobs, key=lambda job: (job[0], job[2])):
+        to_currencies = [to_currency for _, to_currency, _ in group]
+        rates_data = all_rates.get(from_currency)
+        if rates_data is None:
+            if json_output or csv_output:
+                output_error(f"ошибка при получении курсов для {from_currency}", json_output)
+            else:
+                print(_ERR + f"❌ Не удалось получить курсы для {from_currency}")
+            ok = False
+            continue
+        emit_results(amount, from_currency, to_currencies, rates_data, json_output, csv_output, table_output, now)
+    return ok
+
+
+def parse_args(argv):
+    """Разбирает аргументы командной строки за один проход
+
+    Возвращает (flags, options, positional, errors): множество флагов, словарь
+    значений флагов вроде --batch, список позиционных аргументов и список
+    ошибок (неизвестные флаги, флаги без значения). Ошибки не прерывают
+    разбор, чтобы о них можно было сообщить в выбранном формате вывода.
+    """
+    flags = set()
+    options = {}
+    positional = []
+    errors = []
+    it = iter(argv)
+    for arg in it:
+        if arg in VALUE_FLAGS:
+            value = next(it, None)
+            if value is None:
+                errors.append(f"после {arg} укажите значение")
+            else:
+                options[arg] = value
+        elif arg in BOOL_FLAGS:
+            flags.add(arg)
+        elif arg.startswith("--"):
+            errors.append(f"неизвестный флаг {arg}")
+        else:
+            positional.append(arg)
+    return flags, options, positional, errors
+
+
 def main():
     """Главная функция программы"""
+    flags, options, args, arg_errors = parse_args(sys.argv[1:])
+
     # Проверяем флаг --help
-    if len(sys.argv) > 1 and sys.argv[1] in ("--help", "-h"):
+    if "--help" in flags or "-h" in flags:
         print_help()
         return
 
+    # Переносим историю из старого формата, если он остался
+    migrate_legacy_history()
+
     # Проверяем флаг --history
-    if len(sys.argv) > 1 and sys.argv[1] == "--history":
-        filter_pair = sys.argv[2].upper() if len(sys.argv) > 2 else ""
-        show_history(filter_pair)
+    if "--history" in flags:
+        if arg_errors:
+            print(_ERR + f"❌ Ошибка: {'; '.join(arg_errors)}")
+            sys.exit(1)
+        filter_pair = args[0].upper() if args else ""
+        show_history(filter_pair, load_config()["history_max_entries"])
         return
 
     # Загружаем конфигурацию
     cfg = load_config()
 
-    # Проверяем флаги --json, --csv, --table, --offline
-    json_output = False
-    csv_output = False
-    table_output = False
-    offline_mode = False
-    args = sys.argv[1:]
-    for flag in ("--json", "--csv", "--table", "--offline"):
-        if flag in args:
-            args.remove(flag)
-            if flag == "--json":
-                json_output = True
-            elif flag == "--csv":
-                csv_output = True
-            elif flag == "--table":
-                table_output = True
-            elif flag == "--offline":
-                offline_mode = True
+    json_output = "--json" in flags
+    csv_output = "--csv" in flags
+    table_output = "--table" in flags
+    offline_mode = "--offline" in flags
+    batch_file = options.get("--batch")
 
     # Применяем формат вывода из конфига, если нет флагов
     if not json_output and not csv_output and not table_output:
@@ -437,9 +817,29 @@ def main():
         elif cfg["output_format"] == "table":
             table_output = True
 
+    # Строки для пакетного режима берутся только из файла
+    if batch_file and args:
+        arg_errors.append("--batch нельзя сочетать с <from> <to> <amount>")
+
+    # Об ошибках в аргументах сообщаем уже в выбранном формате вывода
+    if arg_errors:
+        if json_output or csv_output:
+            output_error("; ".join(arg_errors), json_output)
+        else:
+            print(_ERR + f"❌ Ошибка: {'; '.join(arg_errors)}")
+        sys.exit(1)
+
     if not json_output and not csv_output:
         print_header()
 
+    if batch_file:
+        now = datetime.now()
+        ok = run_batch(batch_file, json_output, csv_output, table_output, offline_mode, cfg["cache_ttl"], now)
+        trim_history(cfg["history_max_entries"])
+        if not ok:
+            sys.exit(1)
+        return
+
     # Получаем параметры из командной строки или интерактивно
     if len(args) == 3:
         # Режим с аргументами командной строки
@@ -451,13 +851,13 @@ def main():
                 if json_output or csv_output:
                     output_error("сумма должна быть положительной", json_output)
                 else:
-                    print(Fore.RED + "❌ Сумма должна быть положительной!")
+                    print(_ERR + "❌ Сумма должна быть положительной!")
                 sys.exit(1)
         except ValueError:
             if json_output or csv_output:
                 output_error("неверная сумма", json_output)
             else:
-                print(Fore.RED + "❌ Ошибка: неверная сумма")
+                print(_ERR + "❌ Ошибка: неверная сумма")
             sys.exit(1)
     elif len(args) == 0:
         # Интерактивный режим с подсказками из конфига
@@ -472,57 +872,26 @@ def main():
         if json_output or csv_output:
             output_error("неверное количество аргументов", json_output)
         else:
-            print(Fore.RED + f"❌ Использование: {sys.argv[0]} [--json|--csv] <from> <to1[,to2,...]> <amount>")
-            print(Fore.RED + f"   или: {sys.argv[0]} --history")
+            print(_ERR + f"❌ Использование: {sys.argv[0]} [--json|--csv] <from> <to1[,to2,...]> <amount>")
+            print(_ERR + f"   или: {sys.argv[0]} --history")
         sys.exit(1)
 
     # Разбиваем целевые валюты (поддержка USD RUB,EUR,CNY 100)
-    to_currencies = [c.strip() for c in to_currency_raw.split(",") if c.strip()]
+    to_currencies = [c for c in map(str.strip, to_currency_raw.split(",")) if c]
 
     # Получаем курсы валют
-    try:
-        rates_data = get_exchange_rates(from_currency, silent=(json_output or csv_output), offline=offline_mode)
-    except SystemExit:
+    rates_data, err = get_exchange_rates(from_currency, silent=(json_output or csv_output),
+                                         offline=offline_mode, ttl=cfg["cache_ttl"])
+    if err:
+        # В текстовом режиме подробности уже выведены get_exchange_rates
         if json_output or csv_output:
-            output_error("ошибка при получении курсов", json_output)
-        raise
-
-    timestamp = rates_data.get('time_last_updated', 0)
-    update_time = datetime.fromtimestamp(timestamp) if timestamp else datetime.now()
-
-    # Для табличного режима собираем все результаты, затем выводим таблицу
-    if table_output:
-        rows = []
-        for to_currency in to_currencies:
-            try:
-                result, rate = convert_currency(amount, from_currency, to_currency, rates_data)
-            except SystemExit:
-                print(Fore.RED + f"❌ Ошибка конвертации для {to_currency}")
-                continue
-            save_to_history(from_currency, to_currency, amount, result, rate, update_time)
-            rows.append((to_currency, result, rate))
-        print_table(amount, from_currency, rows, rates_data)
-        return
-
-    # Выполняем конвертацию для каждой валюты
-    for to_currency in to_currencies:
-        try:
-            result, rate = convert_currency(amount, from_currency, to_currency, rates_data)
-        except SystemExit:
-            if json_output or csv_output:
-                output_error(f"ошибка конвертации для {to_currency}", json_output)
-            else:
-                print(Fore.RED + f"❌ Ошибка конвертации для {to_currency}")
-            continue
-
-        save_to_history(from_currency, to_currency, amount, result, rate, update_time)
+            output_error(err, json_output)
+        sys.exit(1)
 
-        if json_output:
-            output_json(from_currency, to_currency, amount, result, rate, update_time)
-        elif csv_output:
-            output_csv(from_currency, to_currency, amount, result, rate)
-        else:
-            print_result(amount, from_currency, result, to_currency, rate, rates_data)
+    # Время фиксируется один раз для вывода, истории и CSV/JSON
+    now = datetime.now()
+    emit_results(amount, from_currency, to_currencies, rates_data, json_output, csv_output, table_output, now)
+    trim_history(cfg["history_max_entries"])
 
 
 if __name__ == "__main__":
@@ -4,45 +4,100 @@
 import sys
 import os
 import json
+import shutil
+import tempfile
 import unittest
 from datetime import datetime, timedelta
 from unittest.mock import patch
 from io import StringIO
 
 sys.path.insert(0, os.path.dirname(__file__))
+import main
 from main import (
-    convert_currency,
+    convert_many,
+    _convert_one,
     format_time_ago,
     load_config,
     output_csv,
+    output_error,
     filter_history,
+    load_batch,
+    load_cache,
+    save_cache,
+    fetch_rates,
+    get_exchange_rates,
+    get_exchange_rates_batch,
+    run_batch,
+    _json_loads,
+    _json_dumps,
+    save_to_history,
+    iter_history,
+    migrate_legacy_history,
+    trim_history,
+    show_history,
+    parse_args,
+    print_result,
+    HISTORY_TRIM_SLACK,
     CONFIG_FILE,
 )
 
 
+class TempFilesTestCase(unittest.TestCase):
+    """Перенаправляет кэш и историю во временный каталог на время теста
+
+    Флаг _history_trim_due тоже подменяется, чтобы записи в историю
+    из одного теста не влияли на обрезку в другом.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.cache_file = os.path.join(self.tmp_dir, "cache.json")
+        self.history_file = os.path.join(self.tmp_dir, "history.jsonl")
+        self.legacy_file = os.path.join(self.tmp_dir, "history.json")
+        for name, value in (("CACHE_FILE", self.cache_file),
+                            ("HISTORY_FILE", self.history_file),
+                            ("LEGACY_HISTORY_FILE", self.legacy_file),
+                            ("_history_trim_due", False)):
+            patcher = patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
 class TestConvertCurrency(unittest.TestCase):
     def setUp(self):
         self.rates_data = {
             "rates": {"RUB": 83.63, "EUR": 0.87, "CNY": 6.91}
         }
+        self.rates = self.rates_data["rates"]
 
     def test_success(self):
-        result, rate = convert_currency(100, "USD", "RUB", self.rates_data)
+        result, rate = _convert_one(100, "RUB", self.rates)
         self.assertAlmostEqual(result, 8363.0)
         self.assertAlmostEqual(rate, 83.63)
 
     def test_unknown_currency(self):
-        with self.assertRaises(SystemExit):
-            convert_currency(100, "USD", "XYZ", self.rates_data)
+        self.assertIsNone(_convert_one(100, "XYZ", self.rates))
 
     def test_zero_amount(self):
-        result, rate = convert_currency(0, "USD", "EUR", self.rates_data)
+        result, rate = _convert_one(0, "EUR", self.rates)
         self.assertEqual(result, 0.0)
 
     def test_fractional_amount(self):
-        result, rate = convert_currency(1.5, "USD", "EUR", self.rates_data)
+        result, rate = _convert_one(1.5, "EUR", self.rates)
         self.assertAlmostEqual(result, 1.5 * 0.87)
 
+    def test_convert_many(self):
+        rows = list(convert_many(100, ["RUB", "XYZ", "EUR"], self.rates_data))
+        self.assertEqual([r[0] for r in rows], ["RUB", "XYZ", "EUR"])
+        self.assertAlmostEqual(rows[0][1], 8363.0)
+        self.assertEqual(rows[1], ("XYZ", None, None))
+        self.assertAlmostEqual(rows[2][2], 0.87)
+
+    def test_convert_many_without_rates(self):
+        rows = list(convert_many(100, ["RUB"], {}))
+        self.assertEqual(rows, [("RUB", None, None)])
+
 
 class TestFormatTimeAgo(unittest.TestCase):
     def test_just_now(self):
@@ -69,14 +124,29 @@ class TestFormatTimeAgo(unittest.TestCase):
         result = format_time_ago(timedelta(days=2))
         self.assertIn("дн", result)
 
+    def test_plural_forms(self):
+        self.assertEqual(format_time_ago(timedelta(days=1)), "1 день назад")
+        self.assertEqual(format_time_ago(timedelta(days=21)), "21 день назад")
+        self.assertEqual(format_time_ago(timedelta(days=11)), "11 дней назад")
+        self.assertEqual(format_time_ago(timedelta(hours=22)), "22 часа назад")
+        self.assertEqual(format_time_ago(timedelta(hours=12)), "12 часов назад")
+        self.assertEqual(format_time_ago(timedelta(minutes=1)), "1 минуту назад")
+        self.assertEqual(format_time_ago(timedelta(minutes=45)), "45 минут назад")
+
 
 class TestLoadConfig(unittest.TestCase):
+    def setUp(self):
+        load_config.cache_clear()
+        self.addCleanup(load_config.cache_clear)
+
     def test_defaults_when_no_file(self):
         with patch("builtins.open", side_effect=FileNotFoundError):
             cfg = load_config()
         self.assertEqual(cfg["default_from"], "USD")
         self.assertEqual(cfg["default_to"], "RUB")
         self.assertEqual(cfg["output_format"], "text")
+        self.assertEqual(cfg["cache_ttl"], 60)
+        self.assertEqual(cfg["history_max_entries"], 1000)
 
     def test_from_file(self):
         config_data = {
@@ -84,7 +154,6 @@ class TestLoadConfig(unittest.TestCase):
             "default_to": "cny",
             "output_format": "JSON"
         }
-        import tempfile
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
             json.dump(config_data, f)
             tmp_path = f.name
@@ -104,7 +173,6 @@ class TestLoadConfig(unittest.TestCase):
 
     def test_uppercase_normalization(self):
         config_data = {"default_from": "gbp", "default_to": "jpy", "output_format": "CSV"}
-        import tempfile
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
             json.dump(config_data, f)
             tmp_path = f.name
@@ -122,15 +190,23 @@ class TestLoadConfig(unittest.TestCase):
         self.assertEqual(cfg["default_to"], "JPY")
         self.assertEqual(cfg["output_format"], "csv")
 
+    def test_cached(self):
+        with patch("builtins.open", side_effect=FileNotFoundError) as mock_open:
+            first = load_config()
+            second = load_config()
+        self.assertIs(first, second)
+        self.assertEqual(mock_open.call_count, 1)
+
 
 class TestOutputCSV(unittest.TestCase):
     def test_format(self):
         with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
-            output_csv("USD", "RUB", 100, 8363.0, 83.63)
+            output_csv("USD", "RUB", 100, 8363.0, 83.63, "2026-01-02T15:30:45.123456")
             output = mock_stdout.getvalue().strip()
 
         parts = output.split(",")
         self.assertEqual(len(parts), 6)
+        self.assertEqual(parts[0], "2026-01-02T15:30:45.123456")
         self.assertEqual(parts[1], "USD")
         self.assertEqual(parts[2], "RUB")
         self.assertEqual(parts[3], "100.00")
@@ -138,13 +214,47 @@ class TestOutputCSV(unittest.TestCase):
 
     def test_rate_precision(self):
         with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
-            output_csv("USD", "EUR", 1, 0.87, 0.87)
+            output_csv("USD", "EUR", 1, 0.87, 0.87, "2026-01-02T15:30:45.123456")
             output = mock_stdout.getvalue().strip()
 
         parts = output.split(",")
         self.assertIn("0.870000", parts[5])
 
 
+class TestOutputError(unittest.TestCase):
+    def test_csv_plain(self):
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            output_error("неверная сумма", as_json=False)
+        self.assertEqual(mock_stdout.getvalue(), "error,неверная сумма\n")
+
+    def test_csv_quotes_commas(self):
+        import csv
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            output_error("ошибка чтения файла a,b.csv", as_json=False)
+        row = next(csv.reader(StringIO(mock_stdout.getvalue())))
+        self.assertEqual(row, ["error", "ошибка чтения файла a,b.csv"])
+
+
+class TestPrintResult(unittest.TestCase):
+    def test_output(self):
+        update_time = datetime(2026, 1, 2, 12, 0, 0)
+        now = update_time + timedelta(hours=2)
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            print_result(100, "USD", 8363.0, "RUB", 83.63, update_time, now)
+            output = mock_stdout.getvalue()
+
+        self.assertIn("100.00 USD = 8363.00 RUB", output)
+        self.assertIn("Курс: 1 USD = 83.6300 RUB", output)
+        self.assertIn("Последнее обновление: 2026-01-02 12:00:00 (2 часа назад)", output)
+
+    def test_without_update_time(self):
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            print_result(100, "USD", 8363.0, "RUB", 83.63, None, datetime.now())
+            output = mock_stdout.getvalue()
+
+        self.assertNotIn("Последнее обновление", output)
+
+
 class TestFilterHistory(unittest.TestCase):
     def setUp(self):
         self.history = [
@@ -177,5 +287,415 @@ class TestFilterHistory(unittest.TestCase):
         self.assertEqual(len(result), 0)
 
 
+class TestParseArgs(unittest.TestCase):
+    def test_flags_and_positional(self):
+        flags, options, positional, errors = parse_args(["--json", "USD", "RUB,EUR", "--offline", "100"])
+        self.assertEqual(flags, {"--json", "--offline"})
+        self.assertEqual(options, {})
+        self.assertEqual(positional, ["USD", "RUB,EUR", "100"])
+        self.assertEqual(errors, [])
+
+    def test_value_flag(self):
+        flags, options, positional, errors = parse_args(["--csv", "--batch", "jobs.csv"])
+        self.assertEqual(flags, {"--csv"})
+        self.assertEqual(options, {"--batch": "jobs.csv"})
+        self.assertEqual(positional, [])
+        self.assertEqual(errors, [])
+
+    def test_history_filter(self):
+        flags, _, positional, _ = parse_args(["--history", "usd/rub"])
+        self.assertIn("--history", flags)
+        self.assertEqual(positional, ["usd/rub"])
+
+    def test_missing_value(self):
+        flags, options, _, errors = parse_args(["--json", "--batch"])
+        self.assertEqual(flags, {"--json"})
+        self.assertEqual(options, {})
+        self.assertEqual(len(errors), 1)
+        self.assertIn("--batch", errors[0])
+
+    def test_unknown_flag(self):
+        flags, _, positional, errors = parse_args(["--json", "--xml", "USD", "RUB", "100"])
+        self.assertEqual(flags, {"--json"})
+        self.assertEqual(positional, ["USD", "RUB", "100"])
+        self.assertEqual(errors, ["неизвестный флаг --xml"])
+
+
+class TestMainArgErrors(unittest.TestCase):
+    def _run(self, argv):
+        with patch("sys.argv", ["main.py"] + argv), \
+                patch("main.load_config", return_value={"output_format": "text", "default_from": "USD",
+                                                        "default_to": "RUB", "cache_ttl": 60,
+                                                        "history_max_entries": 1000}), \
+                patch("main.migrate_legacy_history"), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            with self.assertRaises(SystemExit):
+                main.main()
+            return mock_stdout.getvalue()
+
+    def test_unknown_flag_json(self):
+        output = json.loads(self._run(["--json", "--foo", "USD", "RUB", "1"]))
+        self.assertFalse(output["success"])
+        self.assertIn("--foo", output["error"])
+
+    def test_missing_batch_value_csv(self):
+        output = self._run(["--csv", "--batch"])
+        self.assertTrue(output.startswith("error,"))
+        self.assertIn("--batch", output)
+
+    def test_batch_with_positional_json(self):
+        output = json.loads(self._run(["--json", "--batch", "b.csv", "USD", "RUB", "5"]))
+        self.assertFalse(output["success"])
+        self.assertIn("--batch", output["error"])
+
+    def test_batch_with_positional_text(self):
+        output = self._run(["--batch", "b.csv", "USD", "RUB", "5"])
+        self.assertIn("❌ Ошибка: --batch нельзя сочетать", output)
+
+
+class TestJsonHelpers(unittest.TestCase):
+    def test_roundtrip(self):
+        data = {"from_currency": "USD", "note": "курс", "rates": [83.63, 0.87]}
+        raw = _json_dumps(data)
+        self.assertIsInstance(raw, bytes)
+        self.assertIn("курс".encode("utf-8"), raw)
+        self.assertEqual(_json_loads(raw), data)
+
+    def test_invalid_json(self):
+        with self.assertRaises(json.JSONDecodeError):
+            _json_loads(b"{not json")
+
+
+class FakeResponse:
+    def __init__(self, payload=None, status_code=200, headers=None):
+        self.content = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+
+class TestFetchRates(unittest.TestCase):
+    def test_keeps_only_used_fields(self):
+        payload = {
+            "provider": "https://www.exchangerate-api.com",
+            "terms": "https://www.exchangerate-api.com/terms",
+            "base": "USD",
+            "date": "2026-01-02",
+            "time_last_updated": 1767312000,
+            "rates": {"USD": 1, "RUB": 83.63},
+        }
+        response = FakeResponse(payload, headers={"ETag": '"abc"'})
+
+        with patch("main._get_session") as get_session:
+            get_session.return_value.get.return_value = response
+            entry = fetch_rates("USD")
+
+        self.assertEqual(entry["data"], {"time_last_updated": 1767312000,
+                                         "rates": {"USD": 1, "RUB": 83.63}})
+        self.assertEqual(entry["etag"], '"abc"')
+        self.assertIsNone(entry["last_modified"])
+
+    def test_not_modified_reuses_cached_data(self):
+        stale = {
+            "fetched_at": "2026-01-02T10:00:00",
+            "data": {"rates": {"RUB": 83.63}},
+            "etag": '"abc"',
+            "last_modified": "Fri, 02 Jan 2026 00:00:00 GMT",
+        }
+
+        with patch("main._get_session") as get_session:
+            get_session.return_value.get.return_value = FakeResponse(status_code=304)
+            entry = fetch_rates("USD", stale)
+            headers = get_session.return_value.get.call_args.kwargs["headers"]
+
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(headers["If-Modified-Since"], "Fri, 02 Jan 2026 00:00:00 GMT")
+        self.assertEqual(entry["data"], stale["data"])
+        self.assertNotEqual(entry["fetched_at"], stale["fetched_at"])
+
+
+class TestSaveCache(TempFilesTestCase):
+    def test_round_trip(self):
+        save_cache({"USD": {"fetched_at": 1.0}})
+        self.assertEqual(load_cache(), {"USD": {"fetched_at": 1.0}})
+        self.assertEqual(os.listdir(self.tmp_dir), ["cache.json"])
+
+    def test_failed_write_removes_temp_file(self):
+        with patch("main.os.replace", side_effect=OSError):
+            save_cache({"USD": {"fetched_at": 1.0}})
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+
+class TestGetExchangeRates(TempFilesTestCase):
+    def test_success_is_cached(self):
+        entry = {"fetched_at": datetime.now().isoformat(), "data": {"rates": {"RUB": 80.0}}}
+        with patch("main.fetch_rates", return_value=entry) as fetch:
+            data, err = get_exchange_rates("USD", silent=True)
+            cached, cached_err = get_exchange_rates("USD", silent=True)
+
+        self.assertIsNone(err)
+        self.assertEqual(data, {"rates": {"RUB": 80.0}})
+        self.assertEqual(cached, data)
+        self.assertIsNone(cached_err)
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_network_error(self):
+        import requests
+        error = requests.exceptions.ConnectionError("HTTPSConnectionPool(host='x', port=443): offline")
+        with patch("main.fetch_rates", side_effect=error):
+            data, err = get_exchange_rates("USD", silent=True)
+
+        self.assertIsNone(data)
+        self.assertEqual(err, "ошибка при получении курсов")
+
+    def test_network_error_details_in_text_mode(self):
+        import requests
+        with patch("main.fetch_rates", side_effect=requests.exceptions.ConnectionError("offline")), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            data, err = get_exchange_rates("USD")
+
+        self.assertIsNone(data)
+        self.assertIn("offline", mock_stdout.getvalue())
+
+    def test_offline_without_cache(self):
+        data, err = get_exchange_rates("USD", silent=True, offline=True)
+        self.assertIsNone(data)
+        self.assertIn("USD", err)
+
+
+class TestLoadBatch(unittest.TestCase):
+    def _write(self, content):
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8') as f:
+            f.write(content)
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def test_parse(self):
+        path = self._write("# from,to,amount\nusd,rub,100\n\nEUR, CNY, 2.5\n")
+        jobs = load_batch(path)
+        self.assertEqual(jobs, [("USD", "RUB", 100.0), ("EUR", "CNY", 2.5)])
+
+    def test_invalid_amount(self):
+        path = self._write("USD,RUB,abc\n")
+        with self.assertRaises(ValueError):
+            load_batch(path)
+
+    def test_wrong_field_count(self):
+        path = self._write("USD,RUB\n")
+        with self.assertRaises(ValueError):
+            load_batch(path)
+
+
+class TestGetExchangeRatesBatch(TempFilesTestCase):
+    def test_fetches_missing_bases_once(self):
+        fetched = []
+
+        def fake_fetch(base, entry=None):
+            fetched.append(base)
+            return {"fetched_at": datetime.now().isoformat(), "data": {"rates": {"RUB": 80.0}, "base": base}}
+
+        with patch("main.fetch_rates", side_effect=fake_fetch):
+            rates = get_exchange_rates_batch({"USD", "EUR"})
+            again = get_exchange_rates_batch({"USD", "EUR"})
+
+        self.assertEqual(sorted(fetched), ["EUR", "USD"])
+        self.assertEqual(rates["USD"]["base"], "USD")
+        self.assertEqual(again, rates)
+
+    def test_session_created_before_workers(self):
+        import threading
+        created_in = []
+
+        def fake_session():
+            created_in.append(threading.current_thread() is threading.main_thread())
+
+        with patch("main._get_session", side_effect=fake_session), \
+                patch("main.fetch_rates", return_value={"fetched_at": datetime.now().isoformat(), "data": {}}):
+            get_exchange_rates_batch({"USD", "EUR"})
+
+        self.assertEqual(created_in, [True])
+
+    def test_failed_base_is_skipped(self):
+        import requests
+
+        def fake_fetch(base, entry=None):
+            if base == "XYZ":
+                raise requests.exceptions.HTTPError("404")
+            return {"fetched_at": datetime.now().isoformat(), "data": {"rates": {"RUB": 80.0}}}
+
+        with patch("main.fetch_rates", side_effect=fake_fetch):
+            rates = get_exchange_rates_batch({"USD", "XYZ"})
+
+        self.assertIn("USD", rates)
+        self.assertNotIn("XYZ", rates)
+
+
+class TestRunBatch(TempFilesTestCase):
+    def test_output_follows_file_order(self):
+        path = os.path.join(self.tmp_dir, "jobs.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("USD,RUB,100\nEUR,RUB,100\nUSD,EUR,100\n")
+        rates = {
+            "USD": {"rates": {"RUB": 80.0, "EUR": 0.9}},
+            "EUR": {"rates": {"RUB": 90.0}},
+        }
+
+        with patch("main.get_exchange_rates_batch", return_value=rates), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            run_batch(path, False, True, False, False, 60, datetime(2026, 1, 2, 15, 30))
+            lines = mock_stdout.getvalue().splitlines()
+
+        pairs = [tuple(line.split(",")[1:3]) for line in lines]
+        self.assertEqual(pairs, [("USD", "RUB"), ("EUR", "RUB"), ("USD", "EUR")])
+        records = list(iter_history())
+        self.assertEqual([(r["from_currency"], r["to_currency"]) for r in records], pairs)
+
+    def test_missing_rates_reported(self):
+        path = os.path.join(self.tmp_dir, "jobs.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("USD,RUB,100\nEUR,RUB,100\n")
+        rates = {"USD": {"rates": {"RUB": 80.0}}}
+
+        with patch("main.get_exchange_rates_batch", return_value=rates), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            ok = run_batch(path, False, True, False, False, 60, datetime(2026, 1, 2, 15, 30))
+            lines = mock_stdout.getvalue().splitlines()
+
+        self.assertFalse(ok)
+        self.assertEqual(lines[1], "error,ошибка при получении курсов для EUR")
+
+    def test_main_exits_with_error_when_rates_missing(self):
+        path = os.path.join(self.tmp_dir, "jobs.csv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("USD,RUB,100\n")
+        cfg = {"output_format": "text", "default_from": "USD", "default_to": "RUB",
+               "cache_ttl": 60, "history_max_entries": 1000}
+
+        with patch("sys.argv", ["main.py", "--csv", "--offline", "--batch", path]), \
+                patch("main.load_config", return_value=cfg), \
+                patch("sys.stdout", new_callable=StringIO):
+            with self.assertRaises(SystemExit) as ctx:
+                main.main()
+        self.assertEqual(ctx.exception.code, 1)
+
+
+class TestHistoryFile(TempFilesTestCase):
+    def test_append_and_read(self):
+        update_time = datetime(2026, 1, 2, 12, 0, 0)
+        save_to_history("USD", "RUB", 100, 8363.0, 83.63, update_time, "2026-01-02T15:30:45")
+        save_to_history("USD", "EUR", 100, 87.0, 0.87, update_time, "2026-01-02T15:30:45")
+
+        with open(self.history_file, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 2)
+        records = list(iter_history())
+        self.assertEqual([r["to_currency"] for r in records], ["RUB", "EUR"])
+        self.assertEqual(records[0]["rate_update_time"], "2026-01-02T12:00:00")
+        self.assertEqual(records[0]["timestamp"], "2026-01-02T15:30:45")
+
+    def test_skips_corrupted_lines(self):
+        with open(self.history_file, "w", encoding="utf-8") as f:
+            f.write('{"from_currency": "USD", "to_currency": "RUB"}\n{broken\n\n123\n["USD"]\n')
+        self.assertEqual(len(list(iter_history())), 1)
+
+    def test_show_history_output(self):
+        update_time = datetime(2026, 1, 2, 12, 0, 0)
+        save_to_history("USD", "RUB", 100, 8000.0, 80.0, update_time, "2026-01-02T15:30:45")
+        save_to_history("USD", "RUB", 100, 8100.0, 81.0, update_time, "2026-01-02T15:31:00")
+        save_to_history("USD", "EUR", 100, 87.0, 0.87, update_time, "2026-01-02T15:32:00")
+
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            show_history("USD/RUB")
+            output = mock_stdout.getvalue()
+
+        self.assertIn("USD → RUB (2 записей)", output)
+        self.assertNotIn("USD → EUR", output)
+        self.assertIn("▲", output)
+        self.assertIn("Всего записей: 2", output)
+
+    def test_show_history_missing_file(self):
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            show_history()
+        self.assertIn("файл не найден", mock_stdout.getvalue())
+
+    def test_show_history_missing_file_with_filter(self):
+        with patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            show_history("USD/RUB")
+        self.assertIn("файл не найден", mock_stdout.getvalue())
+
+    def test_show_history_read_error_with_filter(self):
+        with patch("main.iter_history", side_effect=PermissionError), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            show_history("USD/RUB")
+        self.assertIn("Ошибка чтения файла истории", mock_stdout.getvalue())
+
+    def test_show_history_respects_max_entries(self):
+        update_time = datetime(2026, 1, 2, 12, 0, 0)
+        for i in range(5):
+            save_to_history("USD", "RUB", 100, 8000.0 + i, 80.0 + i, update_time, "2026-01-02T15:30:45")
+        cfg = {"output_format": "text", "default_from": "USD", "default_to": "RUB",
+               "cache_ttl": 60, "history_max_entries": 3}
+
+        with patch("sys.argv", ["main.py", "--history"]), \
+                patch("main.load_config", return_value=cfg), \
+                patch("sys.stdout", new_callable=StringIO) as mock_stdout:
+            main.main()
+            output = mock_stdout.getvalue()
+
+        self.assertIn("USD → RUB (3 записей)", output)
+        self.assertIn("Всего записей: 3", output)
+        self.assertNotIn("80.0000", output)
+
+    def _write_records(self, count):
+        with open(self.history_file, "w", encoding="utf-8") as f:
+            for i in range(count):
+                f.write(json.dumps({"from_currency": "USD", "to_currency": "RUB", "amount": i}) + "\n")
+
+    def test_trim_keeps_latest(self):
+        self._write_records(10 + HISTORY_TRIM_SLACK + 1)
+        with patch.object(main, "_history_trim_due", True):
+            trim_history(10)
+        amounts = [r["amount"] for r in iter_history()]
+        self.assertEqual(amounts, list(range(HISTORY_TRIM_SLACK + 1, HISTORY_TRIM_SLACK + 11)))
+
+    def test_trim_waits_for_slack(self):
+        self._write_records(10 + HISTORY_TRIM_SLACK)
+        with patch.object(main, "_history_trim_due", True):
+            trim_history(10)
+        self.assertEqual(len(list(iter_history())), 10 + HISTORY_TRIM_SLACK)
+
+    def test_trim_skips_scan_until_due(self):
+        self._write_records(10 + HISTORY_TRIM_SLACK + 1)
+        with patch.object(main, "_history_trim_due", False), \
+                patch("main.deque", side_effect=AssertionError("history scanned")):
+            trim_history(10)
+        self.assertEqual(len(list(iter_history())), 10 + HISTORY_TRIM_SLACK + 1)
+
+    def test_save_marks_trim_due_at_boundary(self):
+        update_time = datetime(2026, 1, 2, 12, 0, 0)
+        with patch.object(main, "_history_trim_due", False), \
+                patch.object(main, "HISTORY_TRIM_CHECK_BYTES", 1024):
+            save_to_history("USD", "RUB", 100, 8363.0, 83.63, update_time, "2026-01-02T15:30:45")
+            self.assertFalse(main._history_trim_due)
+            for _ in range(10):
+                save_to_history("USD", "RUB", 100, 8363.0, 83.63, update_time, "2026-01-02T15:30:45")
+            self.assertTrue(main._history_trim_due)
+
+    def test_migrate_legacy(self):
+        legacy = [{"from_currency": "USD", "to_currency": "RUB", "exchange_rate": 83.0}]
+        with open(self.legacy_file, "w", encoding="utf-8") as f:
+            json.dump(legacy, f)
+        with open(self.history_file, "w", encoding="utf-8") as f:
+            f.write('{"from_currency": "EUR", "to_currency": "CNY", "exchange_rate": 8.0}\n')
+
+        migrate_legacy_history()
+
+        records = list(iter_history())
+        self.assertEqual([r["from_currency"] for r in records], ["USD", "EUR"])
+        self.assertFalse(os.path.exists(self.legacy_file))
+        self.assertTrue(os.path.exists(self.legacy_file + ".bak"))
+
+
 if __name__ == "__main__":
     unittest.main()